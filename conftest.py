@@ -6,6 +6,20 @@ GUYS = ["Albert", "Bob", "Charles", "Devin", "Eli"]
 GIRLS = ["Faith", "Gina", "Heather", "Ingrid", "Joy"]
 
 
+def pytest_addoption(parser):
+    parser.addoption(
+        "--bench-rounds",
+        type=int,
+        default=5,
+        help="number of timed rounds for each pedantic benchmark",
+    )
+
+
+@pytest.fixture()
+def bench_rounds(request):
+    return request.config.getoption("--bench-rounds")
+
+
 @pytest.fixture()
 def names_long():
     return [str(i) for i in range(11)]
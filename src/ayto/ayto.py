@@ -1,14 +1,20 @@
 from __future__ import annotations
 
-from collections import defaultdict
 import json
+from math import factorial
 from pathlib import Path
+from typing import Callable
 
 import numpy as np
 from numpy.typing import NDArray
 import pandas as pd
 
-from .utils import faster_permutations
+from .utils import (
+    faster_permutations,
+    fixed_pair_permutations,
+    permutation_chunks,
+    take_rows,
+)
 
 
 class AYTO:
@@ -31,15 +37,29 @@ class AYTO:
         self.girls = girls
         self.n = len(self.guys)
         self.guy_ids, self.girl_ids = self._initialize_maps()
-        self._scenarios = self._initialize_scenarios()
+        # scenarios are generated lazily, so that the first truth booth or matchup ceremony
+        # can filter them in chunks instead of materializing all n! up front
+        self._scenarios: NDArray | None = None
         self._initialize_probs()
+        self._probabilities: pd.DataFrame | None = None
         self.history: list[dict] = []
 
     @property
     def num_scenarios(self) -> int:
         """How many scenarios remain possible."""
+        if self._scenarios is None:
+            return factorial(self.n)
         return self._scenarios.shape[0]
 
+    @property
+    def probabilities(self) -> pd.DataFrame:
+        """The probability of each couple being a match, with guys as columns and girls as rows."""
+        # the DataFrame is only built when it's asked for (and then reused), so applying
+        # events doesn't pay for constructing one each time
+        if self._probabilities is None:
+            self._probabilities = self._to_dataframe(self._probs)
+        return self._probabilities
+
     def apply_truth_booth(
         self, guy: str, girl: str, match: bool, calc_probs=True
     ) -> int:
@@ -73,8 +93,18 @@ class AYTO:
 
         guy_idx, girl_idx = ids
 
-        idx = self._get_truth_booth_idx(guy_idx, girl_idx, match)
-        self._scenarios = self._scenarios[idx]
+        if match and self._scenarios is None and girl_idx < self.n:
+            # nothing has been filtered yet, so rather than generating all n! scenarios to
+            # keep the 1/n that pair this couple, generate just those (n-1)! directly. (a
+            # girl without a matching guy id never appears in a scenario, so she's left to
+            # the filter, which rules every scenario out)
+            self._scenarios = fixed_pair_permutations(self.n, guy_idx, girl_idx)
+        else:
+            self._filter_scenarios(
+                lambda scenarios: self._get_truth_booth_idx(
+                    scenarios, guy_idx, girl_idx, match
+                )
+            )
 
         if calc_probs:
             self.calculate_probabilities()
@@ -107,8 +137,10 @@ class AYTO:
             Number of scenarios remaining
 
         """
-        idx = self._get_matchup_idx(matchup, beams)
-        self._scenarios = self._scenarios[idx]
+        matchup_ids = self._parse_matchup(matchup)
+        self._filter_scenarios(
+            lambda scenarios: self._get_matchup_idx(scenarios, matchup_ids, beams)
+        )
 
         if calc_probs:
             self.calculate_probabilities()
@@ -155,23 +187,27 @@ class AYTO:
         if (matches is None) and (non_matches is None):
             raise ValueError("Either matches, non_matches, or both must be provided.")
 
-        idx = np.array([True] * self.num_scenarios)
+        scenarios = self._get_scenarios()
 
-        # index = index & (all matches are true)
+        # keep only the scenarios where all matches are true
         if matches:
-            match_idx = self._get_matchup_idx(matches, len(matches))
-            idx = idx & match_idx
+            match_idx = self._get_matchup_idx(
+                scenarios, self._parse_matchup(matches), len(matches)
+            )
+            scenarios = take_rows(scenarios, match_idx)
 
+        # then check the non-matches against just those (usually far fewer) scenarios,
+        # combining them into a single index before selecting any rows
         if non_matches:
-            # for each nonmatch
+            idx = np.ones(scenarios.shape[0], dtype=bool)
             for non_match in non_matches:
                 # index = index & this match is not true
-                non_match_idx = self._get_matchup_idx([non_match], 1)
-                idx = idx & ~non_match_idx
+                guy_idx, girl_idx = self._parse_matchup([non_match])[0]
+                idx &= scenarios[:, guy_idx] != girl_idx
+            scenarios = take_rows(scenarios, idx)
 
-        scenarios = self._scenarios[idx]
         num_hyp_scenarios = scenarios.shape[0]
-        probabilities = self._calculate_probabilities(scenarios)
+        probabilities = self._to_dataframe(self._calculate_probabilities(scenarios))
 
         return num_hyp_scenarios, num_hyp_scenarios / self.num_scenarios, probabilities
 
@@ -186,25 +222,28 @@ class AYTO:
         to calculate the probabilities until the end).
 
         """
-        self.probabilities = self._calculate_probabilities()
-
-    def _parse_matchup(self, matchup: list[tuple[str, str]]) -> list[int]:
-        # ensure all names are known
+        self._probs = self._calculate_probabilities()
+        self._probabilities = None
+
+    def _parse_matchup(self, matchup: list[tuple[str, str]]) -> list[tuple[int, int]]:
+        # only the guys in the matchup get an entry, so filters never touch the columns of
+        # guys left out of a partial matchup. names are looked up directly and only an
+        # unknown name falls back to reporting the valid ones
+        matchup_ids: dict[int, int] = {}
         for guy, girl in matchup:
-            if guy not in self.guy_ids:
+            try:
+                guy_id = self.guy_ids[guy]
+            except KeyError:
                 valid = list(self.guy_ids.keys())
                 raise ValueError(f"Unknown name {guy}, must be one of {valid}")
-            elif girl not in self.girl_ids:
+            try:
+                girl_id = self.girl_ids[girl]
+            except KeyError:
                 valid = list(self.girl_ids.keys())
                 raise ValueError(f"Unknown name {girl}, must be one of {valid}")
+            matchup_ids[guy_id] = girl_id
 
-        matchup_ints = [-1] * self.n
-        for guy, girl in matchup:
-            guy_id = self.guy_ids[guy]
-            girl_id = self.girl_ids[girl]
-            matchup_ints[guy_id] = girl_id
-
-        return matchup_ints
+        return list(matchup_ids.items())
 
     def _initialize_maps(self) -> tuple[dict[str, int], dict[str, int]]:
         guy_ids = {name: id_ for id_, name in enumerate(self.guys)}
@@ -212,37 +251,96 @@ class AYTO:
 
         return guy_ids, girl_ids
 
-    def _initialize_scenarios(self) -> NDArray:
-        scenarios = faster_permutations(self.n)
-
-        return np.array(scenarios)
+    def _get_scenarios(self) -> NDArray:
+        if self._scenarios is None:
+            # faster_permutations already returns a compact uint8 array, so there's no
+            # need to copy it (which would briefly double the memory needed)
+            self._scenarios = faster_permutations(self.n)
+
+        return self._scenarios
+
+    def _filter_scenarios(self, get_idx: Callable[[NDArray], NDArray]):
+        if self._scenarios is not None:
+            self._scenarios = take_rows(self._scenarios, get_idx(self._scenarios))
+            return
+
+        # nothing has been filtered yet, so generate the scenarios in chunks and only keep
+        # each chunk's (boolean) index. chunks are cheap to generate, so a second pass
+        # regenerates them and writes the survivors straight into the final array. peak
+        # memory is then one chunk (1/n of all scenarios) plus whatever survives, rather
+        # than all n! scenarios
+        idxs = [get_idx(chunk) for chunk in permutation_chunks(self.n)]
+        sizes = [int(np.count_nonzero(idx)) for idx in idxs]
+        scenarios = np.empty((sum(sizes), self.n), dtype=np.uint8, order="F")
+        start = 0
+        for chunk, idx, size in zip(permutation_chunks(self.n), idxs, sizes):
+            take_rows(chunk, idx, out=scenarios[start : start + size])
+            start += size
+
+        self._scenarios = scenarios
 
     def _initialize_probs(self):
-        probs = defaultdict(lambda: defaultdict(float))
-        for guy in self.guys:
-            for girl in self.girls:
-                probs[guy][girl] = 1 / self.n
-
-        self.probabilities = pd.DataFrame(probs)
-
-    def _get_matchup_idx(self, matchup: list[tuple[str, str]], beams: int) -> NDArray:
-        matchup_list = self._parse_matchup(matchup)
-        # count number of matches between matchup and each scenario
-        sums = (self._scenarios == matchup_list).sum(axis=1)
-        # true if number of matches is the number of beams, else false
-        idx = sums == beams
+        # _probs[girl_idx, guy_idx] is the probability that that couple is a match
+        self._probs = np.full((len(self.girls), self.n), 1 / self.n)
+
+    def _to_dataframe(self, probs: NDArray) -> pd.DataFrame:
+        return pd.DataFrame(probs, index=self.girls, columns=self.guys)
+
+    def _get_matchup_idx(
+        self, scenarios: NDArray, matchup_ids: list[tuple[int, int]], beams: int
+    ) -> NDArray:
+        if not 0 <= beams <= len(matchup_ids):
+            # there can't be more beams than couples, so no scenario fits
+            return np.zeros(scenarios.shape[0], dtype=bool)
+
+        if len(matchup_ids) == 1 and beams in (0, 1):
+            # a single couple is just a truth booth, so there are no beams to count
+            guy_idx, girl_idx = matchup_ids[0]
+            return self._get_truth_booth_idx(scenarios, guy_idx, girl_idx, beams == 1)
+
+        if len(matchup_ids) > 1 and beams == len(matchup_ids):
+            # every couple has to be a match, so a scenario is ruled out as soon as it misses
+            # one. after the first two couples only ~1/n^2 of the scenarios are left, so the
+            # remaining couples are only checked against those rows instead of every row
+            (guy_idx, girl_idx), (guy_idx_2, girl_idx_2) = matchup_ids[:2]
+            idx = scenarios[:, guy_idx] == girl_idx
+            idx &= scenarios[:, guy_idx_2] == girl_idx_2
+            if len(matchup_ids) > 2:
+                rows = np.flatnonzero(idx)
+                for guy_idx, girl_idx in matchup_ids[2:]:
+                    if rows.shape[0] == 0:
+                        break
+                    rows = rows[scenarios[rows, guy_idx] == girl_idx]
+                idx[:] = False
+                idx[rows] = True
+            return idx
+
+        # count number of matches between matchup and each scenario, one column at a time
+        # (each column is contiguous, and this avoids materializing an (n!, n) temporary).
+        # every comparison is written to the same buffer, which is then added as uint8 so
+        # the sum is a plain byte-wise add
+        sums = np.zeros(scenarios.shape[0], dtype=np.uint8)
+        is_match = np.empty(scenarios.shape[0], dtype=bool)
+        for guy_idx, girl_idx in matchup_ids:
+            np.equal(scenarios[:, guy_idx], girl_idx, out=is_match)
+            sums += is_match.view(np.uint8)
+        # true if number of matches is the number of beams, else false (reusing the
+        # comparison buffer, so the whole filter allocates just two bytes per scenario)
+        idx = np.equal(sums, beams, out=is_match)
         return idx
 
-    def _get_truth_booth_idx(self, guy_idx: int, girl_idx: int, match: bool) -> NDArray:
-        idx = self._scenarios[:, guy_idx] == girl_idx
+    def _get_truth_booth_idx(
+        self, scenarios: NDArray, guy_idx: int, girl_idx: int, match: bool
+    ) -> NDArray:
+        idx = scenarios[:, guy_idx] == girl_idx
         if not match:
             idx = ~idx
 
         return idx
 
-    def _calculate_probabilities(self, scenarios: NDArray | None = None):
+    def _calculate_probabilities(self, scenarios: NDArray | None = None) -> NDArray:
         if scenarios is None:
-            these_scenarios = self._scenarios
+            these_scenarios = self._get_scenarios()
         else:
             these_scenarios = scenarios
 
@@ -252,23 +350,37 @@ class AYTO:
                 "Impossible scenario provided. Did you enter contradictory data?"
             )
 
-        probs: defaultdict[str, defaultdict[str, float]] = defaultdict(
-            lambda: defaultdict(float)
-        )
-
-        # iterate over guys
-        for guy_idx, guy in enumerate(self.guys):
-            # get that guy's column of the scenarios dataframe
-            col = these_scenarios[:, guy_idx]
-            # construct a dictionary counting how many times each girl_idx appears (it's
-            # marginally faster than doing `count = (col == girl_idx).sum()` for each girl)
-            unique, counts = np.unique(col, return_counts=True)
-            count_dict = dict(zip(unique, counts))
-            for girl_idx, girl in enumerate(self.girls):
-                # populate probs dict with probaility = counts / num_scenarios
-                probs[guy][girl] = count_dict.get(girl_idx, 0) / num_scenarios
-
-        return pd.DataFrame(probs)
+        # counts[girl_idx, guy_idx] is how many scenarios pair that guy with that girl.
+        # scenarios only hold ids below n, so with more girls than guys the extra girls
+        # keep a count of 0 (and with fewer, ids without a girl aren't counted)
+        num_girls = len(self.girls)
+        counts = np.zeros((num_girls, self.n), dtype=np.int64)
+        if num_scenarios < 10_000:
+            # for a few scenarios, one `np.bincount` per guy beats n calls per guy
+            for guy_idx in range(self.n):
+                counts[:, guy_idx] = np.bincount(
+                    these_scenarios[:, guy_idx], minlength=num_girls
+                )[:num_girls]
+            return counts / num_scenarios
+
+        # otherwise, counting matches against each girl in a guy's column stays in
+        # uint8/bool, whereas `np.bincount` would first cast the whole column to int64. the
+        # column is made contiguous first in case the scenarios are row-major, and the
+        # comparisons share one preallocated buffer rather than allocating a fresh one
+        # each time
+        # when every id belongs to a girl, each scenario pairs each guy with exactly one
+        # girl, so the last girl's count is whatever is left over and needn't be counted
+        derive_last = num_girls == self.n
+        is_girl = np.empty(num_scenarios, dtype=bool)
+        for guy_idx in range(self.n):
+            col = np.ascontiguousarray(these_scenarios[:, guy_idx])
+            for girl_idx in range(min(num_girls, self.n) - derive_last):
+                np.equal(col, girl_idx, out=is_girl)
+                counts[girl_idx, guy_idx] = np.count_nonzero(is_girl)
+        if derive_last:
+            counts[-1] = num_scenarios - counts[:-1].sum(axis=0)
+
+        return counts / num_scenarios
 
     def _serialize(self) -> dict:
         return {"guys": self.guys, "girls": self.girls, "history": self.history}
@@ -308,14 +420,29 @@ class AYTO:
             if event["type"] == "matchup_ceremony":
                 event["matchup"] = [tuple(pair) for pair in event["matchup"]]
 
+        # the events filter the same set of scenarios, so the order they're replayed in
+        # doesn't change the result. replay the truth booths first (matches, then
+        # non-matches): they only read one column, and a match before anything else skips
+        # generating most scenarios, so the matchup ceremonies then scan far fewer rows
+        events = sorted(
+            data["history"],
+            key=lambda event: (
+                event["type"] != "truth_booth",
+                not event.get("match", False),
+            ),
+        )
+
         instance = cls(data["guys"], data["girls"])
-        for event in data["history"]:
+        for event in events:
+            event = dict(event)
             event_type = event.pop("type")
             if event_type == "truth_booth":
                 instance.apply_truth_booth(**event, calc_probs=False)
             elif event_type == "matchup_ceremony":
                 instance.apply_matchup_ceremony(**event, calc_probs=False)
 
+        # keep the history in the order the events actually happened
+        instance.history = data["history"]
         instance.calculate_probabilities()
 
         return instance
@@ -1,5 +1,6 @@
 import numpy as np
 from math import factorial
+from typing import Iterator, Optional
 from numpy.typing import NDArray
 
 
@@ -12,7 +13,7 @@ def faster_permutations(n: int) -> NDArray:
     # empty() is fast because it does not initialize the values of the array
     # order='F' uses Fortran ordering, which makes accessing elements in the same column fast
     perms = np.empty((factorial(n), n), dtype=np.uint8, order="F")
-    perms[0, 0] = 0
+    perms[0, :1] = 0  # (a slice, so that n=0 gives the single empty permutation)
 
     rows_to_copy = 1
     for i in range(1, n):
@@ -32,3 +33,58 @@ def faster_permutations(n: int) -> NDArray:
         rows_to_copy *= i + 1
 
     return perms
+
+
+def take_rows(arr: NDArray, idx: NDArray, out: Optional[NDArray] = None) -> NDArray:
+    """Select the rows of a 2D array where a boolean index is `True`.
+
+    Equivalent to `arr[idx]`, but gathers one column at a time into a Fortran-ordered
+    output, which is much faster for tall, narrow arrays like the scenarios array and
+    keeps columns contiguous for later filtering. If `out` is provided, the rows are
+    written into it instead of a new array.
+
+    """
+    rows = np.flatnonzero(idx)
+    if out is None:
+        out = np.empty((rows.shape[0], arr.shape[1]), dtype=arr.dtype, order="F")
+    for j in range(arr.shape[1]):
+        np.take(arr[:, j], rows, out=out[:, j], mode="clip")
+
+    return out
+
+
+def permutation_chunks(n: int) -> Iterator[NDArray]:
+    """Generate the permutations 0 to n-1 in n chunks of (n-1)! rows.
+
+    The chunks are consecutive blocks of `faster_permutations(n)`, built the same way (by
+    inserting n-1 into each position of the permutations of 0 to n-2), so together they
+    contain the same rows without ever holding all n! of them in memory at once.
+
+    """
+    rest = faster_permutations(n - 1)
+    for j in range(n):
+        splitter = n - 1 - j
+        chunk = np.empty((rest.shape[0], n), dtype=np.uint8, order="F")
+        chunk[:, splitter] = n - 1
+        chunk[:, :splitter] = rest[:, :splitter]  # left side
+        chunk[:, splitter + 1 :] = rest[:, splitter:]  # right side
+        yield chunk
+
+
+def fixed_pair_permutations(n: int, i: int, value: int) -> NDArray:
+    """Generate the (n-1)! permutations of 0 to n-1 that have `value` in position i.
+
+    These are the permutations of the other n-1 values with `value` inserted at position i,
+    so they can be built directly instead of filtering all n! permutations.
+
+    """
+    rest = faster_permutations(n - 1)
+    perms = np.empty((rest.shape[0], n), dtype=np.uint8, order="F")
+    perms[:, i] = value
+    other_positions = [j for j in range(n) if j != i]
+    for rest_j, j in enumerate(other_positions):
+        # shift values up by one where needed to skip over `value`
+        col = rest[:, rest_j]
+        np.add(col, col >= value, out=perms[:, j])
+
+    return perms
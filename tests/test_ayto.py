@@ -18,6 +18,56 @@ def test_initial_probabilities(ayto_instance: AYTO):
     assert np.allclose(ayto_instance.probabilities, 1 / 5)
 
 
+def test_calculate_initial_probabilities(ayto_instance: AYTO):
+    ayto_instance.calculate_probabilities()
+    assert np.allclose(ayto_instance.probabilities, 1 / 5)
+
+
+def test_probabilities_cached(ayto_instance: AYTO):
+    probabilities = ayto_instance.probabilities
+    assert ayto_instance.probabilities is probabilities
+    ayto_instance.calculate_probabilities()
+    assert ayto_instance.probabilities is not probabilities
+
+
+def test_probabilities_many_scenarios():
+    # enough scenarios to count by comparison rather than by bincount
+    names = [str(i) for i in range(8)]
+    season = AYTO(names, names)
+    season.apply_truth_booth("0", "0", False)
+    expected = np.full((8, 8), 6 / 49)
+    expected[0, :] = 1 / 7
+    expected[:, 0] = 1 / 7
+    expected[0, 0] = 0
+    assert np.allclose(season.probabilities.values, expected)
+
+
+def test_truth_booth_match_extra_girl():
+    # with more girls than guys, the extra girl can't be anyone's match
+    season = AYTO(["Albert", "Bob", "Charles"], ["Faith", "Gina", "Heather", "Ingrid"])
+    assert season.apply_truth_booth("Albert", "Ingrid", True, calc_probs=False) == 0
+
+
+@pytest.mark.parametrize("num_girls", [2, 4])
+@pytest.mark.parametrize("num_guys", [3, 8])
+def test_probabilities_unequal_names(num_guys: int, num_girls: int):
+    # with 8 guys there are enough scenarios to count by comparison rather than bincount
+    guys = [f"guy{i}" for i in range(num_guys)]
+    girls = [f"girl{i}" for i in range(num_girls)]
+    season = AYTO(guys, girls)
+    assert season.probabilities.shape == (num_girls, num_guys)
+    season.apply_truth_booth("guy0", "girl0", False)
+    # girl ids past the last guy never appear, and the rest follow from the n - 1 girls
+    # left for guy 0 (and the n - 1 guys left for girl 0)
+    n = num_guys
+    expected = np.full((num_girls, n), (n - 2) / (n - 1) ** 2)
+    expected[0, :] = 1 / (n - 1)
+    expected[:, 0] = 1 / (n - 1)
+    expected[0, 0] = 0
+    expected[n:, :] = 0
+    assert np.allclose(season.probabilities.values, expected)
+
+
 def test_contradiction(ayto_instance: AYTO):
     ayto_instance.apply_truth_booth("Albert", "Gina", True)
     with pytest.raises(
@@ -29,6 +79,20 @@ def test_contradiction(ayto_instance: AYTO):
         ayto_instance.apply_truth_booth("Albert", "Gina", False)
 
 
+def test_filter_layout(ayto_instance: AYTO):
+    # filtering should never upcast the compact uint8 scenarios, and each guy's column
+    # should stay contiguous, both when the first event writes its survivors chunk by
+    # chunk and when a later event filters the existing scenarios
+    ayto_instance.apply_truth_booth("Albert", "Gina", False, calc_probs=False)
+    assert ayto_instance._scenarios.dtype == np.uint8
+    assert ayto_instance._scenarios.flags["F_CONTIGUOUS"]
+    ayto_instance.apply_matchup_ceremony(
+        [("Albert", "Faith"), ("Bob", "Gina"), ("Charles", "Heather")], 1
+    )
+    assert ayto_instance._scenarios.dtype == np.uint8
+    assert ayto_instance._scenarios.flags["F_CONTIGUOUS"]
+
+
 class TestTruthBooth:
     def test_truth_booth(self, ayto_instance: AYTO):
         num_remaining = ayto_instance.apply_truth_booth("Albert", "Gina", True)
@@ -86,18 +150,28 @@ class TestMatchup:
 
     def test_matchup_results(self, ayto_instance: AYTO):
         ayto_instance.calculate_probabilities()
-        assert np.allclose(
-            ayto_instance.probabilities.values,
-            np.array(
-                [
-                    [0.4, 0.15, 0.15, 0.15, 0.15],
-                    [0.15, 0.4, 0.15, 0.15, 0.15],
-                    [0.15, 0.15, 0.4, 0.15, 0.15],
-                    [0.15, 0.15, 0.15, 0.4, 0.15],
-                    [0.15, 0.15, 0.15, 0.15, 0.4],
-                ]
-            ),
-        )
+        expected = np.full((5, 5), 0.15)
+        np.fill_diagonal(expected, 0.4)
+        assert np.allclose(ayto_instance.probabilities.values, expected)
+
+
+def test_matchup_too_many_beams():
+    season = AYTO(["Albert", "Bob", "Charles"], ["Faith", "Gina", "Heather"])
+    num_remaining = season.apply_matchup_ceremony(
+        [("Albert", "Faith"), ("Bob", "Gina")], 3, calc_probs=False
+    )
+    assert num_remaining == 0
+
+
+def test_matchup_contradictory_couples():
+    # two guys can't both be matched with Faith, so there's no scenario with 3 beams
+    season = AYTO(["Albert", "Bob", "Charles"], ["Faith", "Gina", "Heather"])
+    num_remaining = season.apply_matchup_ceremony(
+        [("Albert", "Faith"), ("Bob", "Faith"), ("Charles", "Gina")],
+        3,
+        calc_probs=False,
+    )
+    assert num_remaining == 0
 
 
 def test_missing_name_guy(ayto_instance: AYTO):
@@ -150,6 +224,24 @@ class TestTryPartial:
         )
         assert (scenarios, p, probs_close) == (4, 1 / 24, True)
 
+    def test_try_partial_many_matches(self, ayto_instance: AYTO):
+        scenarios, p, probs = ayto_instance.try_partial_scenario(
+            matches=[("Albert", "Faith"), ("Bob", "Gina"), ("Charles", "Heather")]
+        )
+        probs_close = np.allclose(
+            probs.values,
+            np.array(
+                [
+                    [1, 0, 0, 0, 0],
+                    [0, 1, 0, 0, 0],
+                    [0, 0, 1, 0, 0],
+                    [0, 0, 0, 0, 1],
+                    [0, 0, 0, 1, 0],
+                ]
+            ),
+        )
+        assert (scenarios, p, probs_close) == (1, 1 / 96, True)
+
     def test_try_partial_non_matches(self, ayto_instance: AYTO):
         scenarios, p, probs = ayto_instance.try_partial_scenario(
             non_matches=[("Albert", "Faith"), ("Bob", "Gina")]
@@ -289,3 +381,20 @@ class TestSaveAndLoad:
                 new_instance.history == ayto_instance.history,
             ]
         )
+
+
+def test_load_replays_in_any_order(path: Path):
+    names = ["A", "B", "C", "D"]
+    season = AYTO(names, names)
+    season.apply_matchup_ceremony([(name, name) for name in names], 1)
+    season.apply_truth_booth("A", "B", True)
+    season.save(path / "out_of_order")
+
+    loaded = AYTO.load(path / "out_of_order")
+    assert all(
+        [
+            loaded.history == season.history,
+            loaded.num_scenarios == season.num_scenarios,
+            np.allclose(loaded.probabilities.values, season.probabilities.values),
+        ]
+    )
@@ -1,13 +1,33 @@
 from __future__ import annotations
 
+import pytest
+
 from ayto import AYTO
+from ayto.utils import faster_permutations, permutation_chunks
 
 
+@pytest.mark.benchmark(group="init")
 def test_benchmark_initialize(benchmark, names_long: list[str]):
     benchmark(AYTO, names_long, names_long)
 
 
-def test_benchmark_truth_booth(benchmark, names_long: list[str]):
+@pytest.mark.benchmark(group="init")
+def test_benchmark_generate_scenarios(benchmark, names_long: list[str]):
+    benchmark(faster_permutations, len(names_long))
+
+
+@pytest.mark.benchmark(group="init")
+def test_benchmark_generate_scenario_chunks(benchmark, names_long: list[str]):
+    # the first event generates its scenarios chunk by chunk, only holding one at a time
+    def generate():
+        for _ in permutation_chunks(len(names_long)):
+            pass
+
+    benchmark(generate)
+
+
+@pytest.mark.benchmark(group="apply")
+def test_benchmark_truth_booth(benchmark, names_long: list[str], bench_rounds: int):
     def setup():
         ayto_instance = AYTO(names_long, names_long)
         return ((ayto_instance,), {})
@@ -17,11 +37,15 @@ def test_benchmark_truth_booth(benchmark, names_long: list[str]):
             names_long[0], names_long[0], False, calc_probs=False
         ),
         setup=setup,
-        rounds=5,
+        rounds=bench_rounds,
+        warmup_rounds=1,
     )
 
 
-def test_benchmark_matchup_ceremony(benchmark, names_long: list[str]):
+@pytest.mark.benchmark(group="apply")
+def test_benchmark_matchup_ceremony(
+    benchmark, names_long: list[str], bench_rounds: int
+):
     def setup():
         ayto_instance = AYTO(names_long, names_long)
         return ((ayto_instance,), {})
@@ -31,16 +55,20 @@ def test_benchmark_matchup_ceremony(benchmark, names_long: list[str]):
     benchmark.pedantic(
         lambda x: x.apply_matchup_ceremony(matchup, 3, calc_probs=False),
         setup=setup,
-        rounds=5,
+        rounds=bench_rounds,
+        warmup_rounds=1,
     )
 
 
-def test_benchmark_calc_probs(benchmark, names_long: list[str]):
-    def setup():
-        ayto_instance = AYTO(names_long, names_long)
-        ayto_instance.apply_truth_booth(
-            names_long[0], names_long[0], False, calc_probs=False
-        )
-        return ((ayto_instance,), {})
+@pytest.mark.benchmark(group="apply")
+def test_benchmark_calc_probs(benchmark, names_long: list[str], bench_rounds: int):
+    # calculating probabilities doesn't change the scenarios, so every round can reuse
+    # the same filtered instance instead of re-applying the truth booth in setup
+    ayto_instance = AYTO(names_long, names_long)
+    ayto_instance.apply_truth_booth(
+        names_long[0], names_long[0], False, calc_probs=False
+    )
 
-    benchmark.pedantic(lambda x: x.calculate_probabilities(), setup=setup, rounds=5)
+    benchmark.pedantic(
+        ayto_instance.calculate_probabilities, rounds=bench_rounds, warmup_rounds=1
+    )
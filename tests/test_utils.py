@@ -1,6 +1,11 @@
 import numpy as np
 
-from ayto.utils import faster_permutations
+from ayto.utils import (
+    faster_permutations,
+    fixed_pair_permutations,
+    permutation_chunks,
+    take_rows,
+)
 
 
 def test_faster_permutations():
@@ -35,3 +40,24 @@ def test_faster_permutations():
             ]
         )
     ).all()
+
+
+def test_take_rows():
+    arr = faster_permutations(3)
+    idx = arr[:, 0] == 1
+    taken = take_rows(arr, idx)
+    assert (taken == arr[idx]).all()
+    assert taken.flags["F_CONTIGUOUS"]
+
+
+def test_permutation_chunks():
+    chunks = list(permutation_chunks(4))
+    assert len(chunks) == 4
+    assert (np.concatenate(chunks) == faster_permutations(4)).all()
+    assert (np.concatenate(list(permutation_chunks(1))) == [[0]]).all()
+
+
+def test_fixed_pair_permutations():
+    perms = faster_permutations(4)
+    fixed = fixed_pair_permutations(4, 1, 2)
+    assert sorted(map(tuple, fixed)) == sorted(map(tuple, perms[perms[:, 1] == 2]))